@@ -1,20 +1,77 @@
 import os
+import logging
+import re
 import json
 import math
-from openai import OpenAI
+import asyncio
+import httpx
+import orjson
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from pprint import pprint
+from functools import lru_cache
+from collections import OrderedDict
 from dotenv import load_dotenv
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
-# Initialize OpenAI client
-client = OpenAI(
+# Initialize OpenAI client on a pooled HTTP/2 connection so the ReAct loop
+# and concurrent sessions reuse TLS connections instead of reconnecting.
+# DefaultAsyncHttpxClient keeps the SDK's own timeout and redirect defaults.
+client = AsyncOpenAI(
     api_key=os.environ.get("OPENAI_API_KEY"),
+    http_client=DefaultAsyncHttpxClient(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=50, max_connections=100),
+    ),
 )
 
+def _dumps(obj: Any) -> str:
+    """
+    Serialize a tool result with orjson, falling back to json for ints beyond 64 bits.
+    
+    Raises ValueError for ints past Python's int-to-str digit limit (4300
+    digits by default); callers must handle it.
+    """
+    try:
+        return orjson.dumps(obj).decode()
+    except orjson.JSONEncodeError:
+        return json.dumps(obj)
+
+def _loads(data: str) -> Any:
+    """Parse tool arguments with orjson, falling back to json when it turned ints beyond 64 bits into floats."""
+    parsed = orjson.loads(data)
+    if isinstance(parsed, dict) and any(isinstance(value, float) for value in parsed.values()):
+        return json.loads(data)
+    return parsed
+
+# Static system prompt shared by every session. Keep it byte-identical and
+# first in the message list so OpenAI prompt caching can reuse the prefix.
+SYSTEM_PROMPT = "You are a helpful AI assistant that can perform combinatorics calculations."
+
+# Stable prompt cache key sent with every request to keep cache routing consistent
+PROMPT_CACHE_KEY = "combinatorics-agent"
+
+# Output caps: tool-selection turns only emit a short tool call, while the
+# turn after tool results carries the final explanation
+TOOL_TURN_MAX_TOKENS = 128
+FINAL_TURN_MAX_TOKENS = 512
+
+# Maximum number of serialized tool results kept by CombinatoricsAgent
+TOOL_CACHE_MAXSIZE = 4096
+
 # Function Implementations
+@lru_cache(maxsize=4096)
+def _comb(n: int, m: int) -> int:
+    return math.comb(n, m)
+
+@lru_cache(maxsize=4096)
+def _perm(n: int, m: int) -> int:
+    return math.perm(n, m)
+
 def calculate_combinations(n: int, m: int):
     """
     Calculate the number of combinations (n choose m).
@@ -26,8 +83,8 @@ def calculate_combinations(n: int, m: int):
     if m == 0 or m == n:
         return {"n": n, "m": m, "combinations": 1}
     
-    # Calculate using math.comb for efficiency
-    result = math.comb(n, m)
+    # Calculate using math.comb, memoized across calls and sessions
+    result = _comb(n, m)
     return {"n": n, "m": m, "combinations": result}
 
 def calculate_permutations(n: int, m: int):
@@ -41,8 +98,8 @@ def calculate_permutations(n: int, m: int):
     if m == 0:
         return {"n": n, "m": m, "permutations": 1}
     
-    # Calculate using math.perm for efficiency
-    result = math.perm(n, m)
+    # Calculate using math.perm, memoized across calls and sessions
+    result = _perm(n, m)
     return {"n": n, "m": m, "permutations": result}
 
 # Define custom tools
@@ -96,89 +153,295 @@ available_functions = {
     "calculate_permutations": calculate_permutations,
 }
 
+# Literal C(n,m)/P(n,m) queries that can be answered locally without a
+# round-trip to the LLM. Anchored to the whole message so any extra wording
+# (constraints, repetition, roles) goes to the full agent. Arguments are
+# limited to 3 digits so the result is cheap to compute on the event loop
+# and stays well within Python's int-to-str digit limit.
+LITERAL_PATTERN = re.compile(r"^\s*(?:what\s+is\s+)?([CP])\((\d{1,3}),\s*(\d{1,3})\)\s*\??\s*$", re.I)
+
 
 class CombinatoricsAgent:
     """A ReAct (Reason and Act) agent that handles combinatorics calculations."""
     
-    def __init__(self, model: str = "gpt-4o"):
+    __slots__ = ("model", "max_iterations")
+    
+    # Serialized tool results keyed by (function name, sorted arguments),
+    # shared across sessions since the tools are pure functions. Kept in LRU
+    # order and bounded by TOOL_CACHE_MAXSIZE.
+    _tool_cache: "OrderedDict[tuple, str]" = OrderedDict()
+    
+    def __init__(self, model: str = "gpt-4o-mini"):
         self.model = model
         self.max_iterations = 10  # Prevent infinite loops
         
-    def run(self, messages: List[Dict[str, Any]]) -> str:
+    def _try_fast_path(self, messages: List[Dict[str, Any]]) -> Optional[str]:
+        """
+        Answer trivial combinatorics questions without calling the LLM.
+        
+        Returns None when the last user message is not a plain C(n,m)/P(n,m)
+        query with arguments below 1000, or the input is invalid, so the
+        caller falls back to the agent.
+        """
+        if not messages or messages[-1]["role"] != "user":
+            return None
+        text = messages[-1]["content"]
+        # Content may also be a list of content parts
+        if not isinstance(text, str):
+            return None
+        
+        match = LITERAL_PATTERN.match(text)
+        if not match:
+            return None
+        kind, n, m = match.group(1).upper(), int(match.group(2)), int(match.group(3))
+        
+        if kind == "C":
+            result = calculate_combinations(n, m)
+            value = result.get("combinations")
+        else:
+            result = calculate_permutations(n, m)
+            value = result.get("permutations")
+        
+        # Let the agent explain invalid inputs
+        if value is None:
+            return None
+        return f"{kind}({n},{m}) = {value}"
+    
+    @classmethod
+    def _cache_get(cls, cache_key: tuple) -> Optional[str]:
+        """Return a cached tool result and mark it as recently used."""
+        function_response = cls._tool_cache.get(cache_key)
+        if function_response is not None:
+            cls._tool_cache.move_to_end(cache_key)
+        return function_response
+    
+    @classmethod
+    def _cache_put(cls, cache_key: tuple, function_response: str) -> None:
+        """Cache a tool result, evicting the least recently used ones over the limit."""
+        cls._tool_cache[cache_key] = function_response
+        cls._tool_cache.move_to_end(cache_key)
+        while len(cls._tool_cache) > TOOL_CACHE_MAXSIZE:
+            cls._tool_cache.popitem(last=False)
+    
+    def _start_tool_call(
+        self,
+        tool_call: Dict[str, Any],
+        pending: Dict[tuple, asyncio.Task],
+        results: Dict[tuple, str],
+    ) -> tuple:
+        """
+        Parse a completed streamed tool call and schedule it in the background
+        unless its result is already cached or scheduled. Cache hits are copied
+        into results right away so later evictions cannot drop them mid-turn.
+        
+        Unknown tools and malformed arguments are not raised; the serialized
+        error is returned instead so it can be sent back to the model.
+        """
+        function_name = tool_call["function"]["name"]
+        if function_name not in available_functions:
+            return tool_call, function_name, None, _dumps({"error": f"Unknown tool: {function_name}"})
+        
+        try:
+            function_args = _loads(tool_call["function"]["arguments"])
+            if not isinstance(function_args, dict):
+                raise ValueError("arguments must be a JSON object")
+            cache_key = (function_name, tuple(sorted(function_args.items())))
+            hash(cache_key)
+        except (ValueError, TypeError) as e:
+            return tool_call, function_name, None, _dumps({"error": f"Invalid arguments: {e}"})
+        logger.debug("Executing tool: %s(%s)", function_name, function_args)
+        
+        if cache_key not in results and cache_key not in pending:
+            function_response = self._cache_get(cache_key)
+            if function_response is not None:
+                results[cache_key] = function_response
+            else:
+                pending[cache_key] = asyncio.create_task(
+                    asyncio.to_thread(available_functions[function_name], **function_args)
+                )
+        return tool_call, function_name, cache_key, None
+    
+    @staticmethod
+    async def _cancel_pending(pending: Dict[tuple, asyncio.Task]) -> None:
+        """Cancel background tool tasks and retrieve their outcome so none leak."""
+        for task in pending.values():
+            task.cancel()
+        await asyncio.gather(*pending.values(), return_exceptions=True)
+    
+    async def run(self, messages: List[Dict[str, Any]]) -> str:
         """
         Run the ReAct loop until we get a final answer.
         
         The agent will:
-        1. Call the LLM
-        2. If tool calls are returned, execute them
+        1. Stream the LLM response
+        2. Start each returned tool call as soon as its arguments are complete
         3. Add results to conversation and repeat
         4. Continue until LLM returns only text (no tool calls)
         """
+        final_content = self._try_fast_path(messages)
+        if final_content is not None:
+            messages.append({
+                "role": "assistant",
+                "content": final_content
+            })
+            logger.debug("Final answer (fast path): %s", final_content)
+            return final_content
+        
         iteration = 0
+        tool_choice = "auto"
+        # Tool calls already answered in this session, and how many turns in a
+        # row have asked for nothing but those
+        seen_calls = set()
+        repeated_turns = 0
+        # Set once a turn is cut off by the smaller tool-turn cap
+        use_final_cap = False
         
         while iteration < self.max_iterations:
             iteration += 1
-            print(f"\n--- Iteration {iteration} ---")
+            logger.debug("--- Iteration %d ---", iteration)
             
-            # Call the LLM
-            response = client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                tools=tools,
-                tool_choice="auto",
-                parallel_tool_calls=False
-            )
+            # After tool results the model is expected to write the final answer;
+            # a turn already cut off by the smaller cap is retried with this one too
+            if use_final_cap or messages[-1]["role"] == "tool" or tool_choice == "none":
+                max_tokens = FINAL_TURN_MAX_TOKENS
+            else:
+                max_tokens = TOOL_TURN_MAX_TOKENS
             
-            response_message = response.choices[0].message
-            print(f"LLM Response: {response_message}")
+            content_parts = []
+            tool_calls = []
+            calls = []  # (tool_call, function_name, cache_key, error) in request order
+            pending = {}  # cache_key -> running tool task
+            results = {}  # cache_key -> serialized tool result for this turn
+            finish_reason = None
+            
+            try:
+                # Stream the LLM response so tool calls can start running as soon
+                # as their arguments are complete, while the model keeps decoding
+                stream = await client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    tools=tools,
+                    tool_choice=tool_choice,
+                    parallel_tool_calls=True,
+                    stream=True,
+                    prompt_cache_key=PROMPT_CACHE_KEY,
+                    temperature=0,
+                    max_tokens=max_tokens
+                )
+                
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    finish_reason = chunk.choices[0].finish_reason or finish_reason
+                    
+                    if delta.content:
+                        content_parts.append(delta.content)
+                    
+                    for tc_delta in delta.tool_calls or []:
+                        if tc_delta.index >= len(tool_calls):
+                            # A new tool call begins, so the previous one's arguments are complete
+                            if tool_calls:
+                                calls.append(self._start_tool_call(tool_calls[-1], pending, results))
+                            tool_calls.append({
+                                "id": tc_delta.id,
+                                "type": "function",
+                                "function": {"name": "", "arguments": ""},
+                            })
+                        
+                        tool_call = tool_calls[tc_delta.index]
+                        if tc_delta.id:
+                            tool_call["id"] = tc_delta.id
+                        if tc_delta.function:
+                            if tc_delta.function.name:
+                                tool_call["function"]["name"] += tc_delta.function.name
+                            if tc_delta.function.arguments:
+                                tool_call["function"]["arguments"] += tc_delta.function.arguments
+                
+                if finish_reason == "length":
+                    # The output was cut off by max_tokens, so the last tool
+                    # call's arguments may be truncated; discard the whole turn
+                    await self._cancel_pending(pending)
+                else:
+                    # The last tool call is complete once the stream ends
+                    if tool_calls:
+                        calls.append(self._start_tool_call(tool_calls[-1], pending, results))
+                    
+                    # Wait for the tool calls that were not served from the cache
+                    function_responses = await asyncio.gather(*pending.values(), return_exceptions=True)
+            except BaseException:
+                # Don't leave background tool tasks running or unretrieved
+                await self._cancel_pending(pending)
+                raise
+            
+            content = "".join(content_parts) or None
+            logger.debug("LLM response: content=%s tool_calls=%s", content, tool_calls)
+            
+            if finish_reason == "length":
+                if max_tokens < FINAL_TURN_MAX_TOKENS:
+                    logger.debug("Response cut off at %d tokens, retrying with a larger cap", max_tokens)
+                    use_final_cap = True
+                    continue
+                return "Error: The response was cut off before a complete answer was produced."
             
             # Check if there are tool calls
-            if response_message.tool_calls:
+            if tool_calls:
                 # Add the assistant's message with tool calls to history
                 messages.append({
                     "role": "assistant",
-                    "content": response_message.content,
-                    "tool_calls": [
-                        {
-                            "id": tc.id,
-                            "type": "function",
-                            "function": {
-                                "name": tc.function.name,
-                                "arguments": tc.function.arguments,
-                            }
-                        }
-                        for tc in response_message.tool_calls
-                    ]
+                    "content": content,
+                    "tool_calls": tool_calls,
                 })
                 
-                # Process ALL tool calls
-                for tool_call in response_message.tool_calls:
-                    function_name = tool_call.function.name
-                    function_args = json.loads(tool_call.function.arguments)
-                    tool_id = tool_call.id
-                    
-                    print(f"Executing tool: {function_name}({function_args})")
-                    
-                    # Call the function
-                    function_to_call = available_functions[function_name]
-                    function_response = function_to_call(**function_args)
-                    
-                    print(f"Tool result: {function_response}")
+                # Repeated calls are answered from the cache without running the tool again
+                turn_calls = {cache_key for _, _, cache_key, error in calls if error is None}
+                if all(error is None for *_, error in calls) and turn_calls <= seen_calls:
+                    repeated_turns += 1
+                else:
+                    repeated_turns = 0
+                seen_calls |= turn_calls
+                
+                # Failed tool runs are reported back to the model and not cached
+                for cache_key, function_response in zip(pending, function_responses):
+                    if isinstance(function_response, Exception):
+                        results[cache_key] = _dumps({"error": f"Tool failed: {function_response}"})
+                        continue
+                    try:
+                        results[cache_key] = _dumps(function_response)
+                    except ValueError as e:
+                        # Result too large to serialize
+                        results[cache_key] = _dumps({"error": f"Tool failed: {e}"})
+                        continue
+                    self._cache_put(cache_key, results[cache_key])
+                
+                # Add tool responses to messages in the order they were requested
+                for tool_call, function_name, cache_key, error in calls:
+                    function_response = error if error is not None else results[cache_key]
+                    logger.debug("Tool result: %s", function_response)
                     
-                    # Add tool response to messages
                     messages.append({
                         "role": "tool",
-                        "tool_call_id": tool_id,
+                        "tool_call_id": tool_call["id"],
                         "name": function_name,
-                        "content": json.dumps(function_response),
+                        "content": function_response,
                     })
                 
+                # The model keeps asking for results it already has, so stop
+                # offering tools and ask it to answer
+                if repeated_turns >= 2:
+                    logger.debug("Repeated tool calls detected, forcing a final answer")
+                    messages.append({
+                        "role": "user",
+                        "content": "You already have all the tool results you need. Please give your final answer now."
+                    })
+                    tool_choice = "none"
+                
                 # Continue the loop to get the next response
                 continue
                 
             else:
                 # No tool calls - we have our final answer
-                final_content = response_message.content
+                final_content = content
                 
                 # Add the final assistant message to history
                 messages.append({
@@ -186,57 +449,52 @@ class CombinatoricsAgent:
                     "content": final_content
                 })
                 
-                print(f"\nFinal answer: {final_content}")
+                logger.debug("Final answer: %s", final_content)
                 return final_content
         
         # If we hit max iterations, return an error
         return "Error: Maximum iterations reached without getting a final answer."
 
 
-def main():
-    # Create a Combinatorics agent
+async def main():
+    # Create a Combinatorics agent; it holds no per-session state, so one
+    # instance can serve all examples concurrently
     agent = CombinatoricsAgent()
     
-    # Example 1: Simple combination calculation
-    print("=== Example 1: Simple Combination ===")
-    messages1 = [
-        {"role": "system", "content": "You are a helpful AI assistant that can perform combinatorics calculations."},
-        {"role": "user", "content": "How many ways can I choose 3 items from 10 items?"},
-    ]
-    
-    result1 = agent.run(messages1.copy())
-    print(f"\nResult: {result1}")
-    
-    # Example 2: Multiple calculations
-    print("\n\n=== Example 2: Multiple Calculations ===")
-    messages2 = [
-        {"role": "system", "content": "You are a helpful AI assistant that can perform combinatorics calculations."},
-        {"role": "user", "content": "Calculate both the combinations and permutations for choosing 2 items from 5 items. Explain the difference."},
+    examples = [
+        # Example 1: Simple combination calculation
+        ("Example 1: Simple Combination", [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": "How many ways can I choose 3 items from 10 items?"},
+        ]),
+        # Example 2: Multiple calculations
+        ("Example 2: Multiple Calculations", [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": "Calculate both the combinations and permutations for choosing 2 items from 5 items. Explain the difference."},
+        ]),
+        # Example 3: Real-world problem
+        ("Example 3: Real-world Problem", [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": "In a lottery where you need to pick 6 numbers from 49, how many different combinations are possible?"},
+        ]),
+        # Example 4: Error handling
+        ("Example 4: Error Handling", [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": "What happens if I try to choose 5 items from 3 items?"},
+        ]),
     ]
     
-    result2 = agent.run(messages2.copy())
-    print(f"\nResult: {result2}")
-    
-    # Example 3: Real-world problem
-    print("\n\n=== Example 3: Real-world Problem ===")
-    messages3 = [
-        {"role": "system", "content": "You are a helpful AI assistant that can perform combinatorics calculations."},
-        {"role": "user", "content": "In a lottery where you need to pick 6 numbers from 49, how many different combinations are possible?"},
-    ]
-    
-    result3 = agent.run(messages3.copy())
-    print(f"\nResult: {result3}")
-    
-    # Example 4: Error handling
-    print("\n\n=== Example 4: Error Handling ===")
-    messages4 = [
-        {"role": "system", "content": "You are a helpful AI assistant that can perform combinatorics calculations."},
-        {"role": "user", "content": "What happens if I try to choose 5 items from 3 items?"},
-    ]
+    # Each session works on its own message list, so they all run concurrently
+    try:
+        results = await asyncio.gather(*(agent.run(messages.copy()) for _, messages in examples))
+    finally:
+        # Close pooled connections while the event loop is still running
+        await client.close()
     
-    result4 = agent.run(messages4.copy())
-    print(f"\nResult: {result4}")
+    for (title, _), result in zip(examples, results):
+        print(f"\n\n=== {title} ===")
+        print(f"\nResult: {result}")
 
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
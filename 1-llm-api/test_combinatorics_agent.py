@@ -0,0 +1,248 @@
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+
+# The module creates its OpenAI client at import time
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+import combinatorics_agent
+from combinatorics_agent import CombinatoricsAgent, _loads
+
+
+def tool_delta(index, id=None, name=None, arguments=None):
+    return SimpleNamespace(
+        index=index, id=id, function=SimpleNamespace(name=name, arguments=arguments)
+    )
+
+
+def chunk(content=None, tool_calls=None, finish_reason=None):
+    delta = SimpleNamespace(content=content, tool_calls=tool_calls)
+    return SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=finish_reason)])
+
+
+class FakeCompletions:
+    """Replays one list of chunks per create() call and records the requests."""
+    
+    def __init__(self, *turns):
+        self.turns = list(turns)
+        self.requests = []
+    
+    async def create(self, **kwargs):
+        self.requests.append(kwargs)
+        chunks = self.turns.pop(0)
+        
+        async def stream():
+            for item in chunks:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        return stream()
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    def install(*turns):
+        completions = FakeCompletions(*turns)
+        fake_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        monkeypatch.setattr(combinatorics_agent, "client", fake_client)
+        return completions
+    monkeypatch.setattr(CombinatoricsAgent, "_tool_cache", OrderedDict())
+    return install
+
+
+def user_messages(content):
+    return [{"role": "user", "content": content}]
+
+
+def fast_path(content):
+    return CombinatoricsAgent()._try_fast_path([{"role": "user", "content": content}])
+
+
+@pytest.mark.parametrize("content, expected", [
+    ("C(10,3)", "C(10,3) = 120"),
+    ("What is P(5, 2)?", "P(5,2) = 20"),
+    ("c(49,6)", "C(49,6) = 13983816"),
+    ("What is C(7,0)?", "C(7,0) = 1"),
+    ("C(999,2)", "C(999,2) = 498501"),
+])
+def test_fast_path_answers_literal_queries(content, expected):
+    assert fast_path(content) == expected
+
+
+@pytest.mark.parametrize("content", [
+    "How many ways can I choose 3 items from 10 items?",
+    "choose 3 items from 10 items if two specific items must always be included",
+    "choose 2 scoops from 5 flavors with repetition allowed",
+    "select 3 people from 10 to be president, VP and treasurer",
+    "choose 3 from 10 and then 2 from 7",
+    "What is C(10,3) if order matters?",
+    "C(10,3) + C(5,2)",
+    "C(1000,500)",
+    "C(20000,10000)",
+    "P(" + "9" * 5000 + ",1)",
+])
+def test_fast_path_defers_free_text_to_agent(content):
+    assert fast_path(content) is None
+
+
+def test_fast_path_defers_invalid_input_to_agent():
+    assert fast_path("C(3,5)") is None
+
+
+def test_fast_path_ignores_content_parts():
+    assert fast_path([{"type": "text", "text": "C(10,3)"}]) is None
+
+
+def test_fast_path_only_answers_user_messages():
+    agent = CombinatoricsAgent()
+    assert agent._try_fast_path([]) is None
+    assert agent._try_fast_path([{"role": "system", "content": "C(10,3)"}]) is None
+
+
+def test_tool_cache_evicts_least_recently_used(monkeypatch):
+    monkeypatch.setattr(CombinatoricsAgent, "_tool_cache", OrderedDict())
+    monkeypatch.setattr(combinatorics_agent, "TOOL_CACHE_MAXSIZE", 2)
+    
+    CombinatoricsAgent._cache_put("a", "1")
+    CombinatoricsAgent._cache_put("b", "2")
+    assert CombinatoricsAgent._cache_get("a") == "1"
+    CombinatoricsAgent._cache_put("c", "3")
+    
+    assert CombinatoricsAgent._cache_get("b") is None
+    assert list(CombinatoricsAgent._tool_cache) == ["a", "c"]
+
+
+def test_loads_keeps_wide_integers_exact():
+    args = _loads('{"n": 100000000000000000000000, "m": 2}')
+    assert args == {"n": 100000000000000000000000, "m": 2}
+    assert isinstance(args["n"], int)
+
+
+def test_run_executes_streamed_tool_calls(fake_llm):
+    completions = fake_llm(
+        [
+            chunk(tool_calls=[tool_delta(0, "a", "calculate_combinations", '{"n": 5,')]),
+            chunk(tool_calls=[tool_delta(0, arguments=' "m": 2}')]),
+            chunk(tool_calls=[tool_delta(1, "b", "calculate_permutations", '{"n": 5, "m": 2}')]),
+            chunk(finish_reason="tool_calls"),
+        ],
+        [chunk("10 and 20"), chunk(finish_reason="stop")],
+    )
+    messages = user_messages("Compare combinations and permutations of 5 and 2")
+    
+    assert asyncio.run(CombinatoricsAgent().run(messages)) == "10 and 20"
+    tool_messages = [m for m in messages if m["role"] == "tool"]
+    assert [m["tool_call_id"] for m in tool_messages] == ["a", "b"]
+    assert json.loads(tool_messages[0]["content"])["combinations"] == 10
+    assert json.loads(tool_messages[1]["content"])["permutations"] == 20
+    assert all(
+        r["prompt_cache_key"] == combinatorics_agent.PROMPT_CACHE_KEY and "user" not in r
+        for r in completions.requests
+    )
+
+
+def test_run_reports_bad_tool_calls_to_the_model(fake_llm):
+    fake_llm(
+        [
+            chunk(tool_calls=[tool_delta(0, "a", "calculate_factorial", '{"n": 5}')]),
+            chunk(tool_calls=[tool_delta(1, "b", "calculate_combinations", '{"n": 5')]),
+            chunk(tool_calls=[tool_delta(2, "c", "calculate_combinations", '{"n": 1.5, "m": 1}')]),
+            chunk(finish_reason="tool_calls"),
+        ],
+        [chunk("Sorry"), chunk(finish_reason="stop")],
+    )
+    messages = user_messages("Do something odd")
+    
+    assert asyncio.run(CombinatoricsAgent().run(messages)) == "Sorry"
+    errors = [m["content"] for m in messages if m["role"] == "tool"]
+    assert "Unknown tool" in errors[0]
+    assert "Invalid arguments" in errors[1]
+    assert "Tool failed" in errors[2]
+    assert not CombinatoricsAgent._tool_cache
+
+
+def test_run_reports_unserializable_tool_results_to_the_model(fake_llm):
+    fake_llm(
+        [
+            chunk(tool_calls=[tool_delta(0, "a", "calculate_combinations", '{"n": 20000, "m": 10000}')]),
+            chunk(finish_reason="tool_calls"),
+        ],
+        [chunk("Too large"), chunk(finish_reason="stop")],
+    )
+    messages = user_messages("How many ways to choose 10000 of 20000?")
+    
+    assert asyncio.run(CombinatoricsAgent().run(messages)) == "Too large"
+    tool_message = next(m for m in messages if m["role"] == "tool")
+    assert "Tool failed" in json.loads(tool_message["content"])["error"]
+    assert not CombinatoricsAgent._tool_cache
+
+
+def test_run_cancels_tool_tasks_when_the_stream_fails(fake_llm):
+    fake_llm([
+        chunk(tool_calls=[tool_delta(0, "a", "calculate_combinations", '{"n": 5, "m": 2}')]),
+        chunk(tool_calls=[tool_delta(1, "b", "calculate_permutations", '{"n": 5,')]),
+        ConnectionError("stream dropped"),
+    ])
+    
+    async def run_and_check():
+        with pytest.raises(ConnectionError):
+            await CombinatoricsAgent().run(user_messages("Compare 5 and 2"))
+        current = asyncio.current_task()
+        assert all(task is current for task in asyncio.all_tasks())
+    
+    asyncio.run(run_and_check())
+
+
+def test_run_retries_truncated_turn_with_final_cap(fake_llm):
+    completions = fake_llm(
+        [chunk("Choosing 5 items from 3 is"), chunk(finish_reason="length")],
+        [chunk("impossible, since 5 > 3."), chunk(finish_reason="stop")],
+    )
+    messages = user_messages("What happens if I try to choose 5 items from 3 items?")
+    
+    assert asyncio.run(CombinatoricsAgent().run(messages)) == "impossible, since 5 > 3."
+    assert [r["max_tokens"] for r in completions.requests] == [
+        combinatorics_agent.TOOL_TURN_MAX_TOKENS,
+        combinatorics_agent.FINAL_TURN_MAX_TOKENS,
+    ]
+    assert [m["role"] for m in messages] == ["user", "assistant"]
+
+
+def test_run_never_parses_truncated_tool_arguments(fake_llm):
+    fake_llm(
+        [
+            chunk(tool_calls=[tool_delta(0, "a", "calculate_combinations", '{"n": 5, "m": 2}')]),
+            chunk(tool_calls=[tool_delta(1, "b", "calculate_permutations", '{"n": 5, "m"')]),
+            chunk(finish_reason="length"),
+        ],
+        [chunk("gave up"), chunk(finish_reason="length")],
+    )
+    messages = user_messages("Compare combinations and permutations of 5 and 2")
+    
+    result = asyncio.run(CombinatoricsAgent().run(messages))
+    assert result.startswith("Error: The response was cut off")
+    assert [m["role"] for m in messages] == ["user"]
+
+
+@pytest.mark.parametrize("copies", [1, 2])
+def test_run_forces_final_answer_on_repeated_tool_calls(fake_llm, copies):
+    def repeated_turn(turn):
+        return [
+            chunk(tool_calls=[tool_delta(i, f"{turn}-{i}", "calculate_combinations", '{"n": 5, "m": 2}')])
+            for i in range(copies)
+        ] + [chunk(finish_reason="tool_calls")]
+    
+    completions = fake_llm(
+        repeated_turn(1),
+        repeated_turn(2),
+        repeated_turn(3),
+        [chunk("C(5,2) = 10"), chunk(finish_reason="stop")],
+    )
+    messages = user_messages("How many ways to choose 2 of 5?")
+    
+    assert asyncio.run(CombinatoricsAgent().run(messages)) == "C(5,2) = 10"
+    assert [r["tool_choice"] for r in completions.requests] == ["auto", "auto", "auto", "none"]